@@ -1,19 +1,114 @@
 import os
 import pandas as pd
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g, has_request_context
 from flask_cors import CORS
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
 from dotenv import load_dotenv
 from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import count
 import numpy as np
 import psycopg2
+import psycopg2.errors
 import json
+import cProfile
+import io
+import pstats
+import queue
+import random
+import select
+import socket
+import threading
+import time
 
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)
 
+# Сколько вопросов пакетного запроса выполняется одновременно
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', 4))
+
+# Бюджеты вопросов: предельное время запроса (statement_timeout, мс)
+# и вес в общем лимите тяжелых запросов (0 - лимит не применяется)
+QUERY_BUDGETS = {
+    1: {'timeout_ms': 5000, 'weight': 0},
+    2: {'timeout_ms': 10000, 'weight': 1},
+    3: {'timeout_ms': 30000, 'weight': 3},
+    4: {'timeout_ms': 15000, 'weight': 1},
+    5: {'timeout_ms': 15000, 'weight': 2},
+    6: {'timeout_ms': 30000, 'weight': 3},
+}
+HEALTH_TIMEOUT_MS = 2000
+
+# Суммарный вес одновременно выполняемых тяжелых запросов
+HEAVY_QUERY_CAPACITY = int(os.getenv('HEAVY_QUERY_CAPACITY', 6))
+# Сколько секунд запрос ждет в очереди, прежде чем получить 429
+ADMISSION_WAIT = float(os.getenv('ADMISSION_WAIT', 2))
+RETRY_AFTER = int(os.getenv('RETRY_AFTER', 5))
+# Как часто проверять, не отключился ли клиент (секунды)
+DISCONNECT_POLL = 0.5
+
+# Реплики для чтения: REPLICA_HOSTS=host1,host2:6433; запись и загрузка идут в HOST
+REPLICA_HOSTS = [h.strip() for h in os.getenv('REPLICA_HOSTS', '').split(',') if h.strip()]
+# Допустимое отставание реплики (секунды), при большем чтение уходит на мастер
+MAX_REPLICA_LAG = float(os.getenv('MAX_REPLICA_LAG', 30))
+# Как долго доверять последней проверке реплики (секунды)
+REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', 10))
+CONNECT_TIMEOUT = int(os.getenv('CONNECT_TIMEOUT', 5))
+
+# Уведомления о загрузках: канал NOTIFY из load_data.py и кеш ответов
+LOAD_CHANNEL = 'visits_loaded'
+ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', 256))
+LISTEN_POLL = 30
+LISTEN_RETRY = 5
+SSE_HEARTBEAT = 15
+SSE_QUEUE_SIZE = 100
+
+# Архив: месяцы старше ARCHIVE_HORIZON_MONTHS переносит load_data.py --archive
+ARCHIVE_TABLE = 'visits_archive'
+archive_exists = False
+
+# Приближенные ответы (approx=<доля>): фиксированное зерно выборки,
+# чтобы повторные запросы давали одинаковый результат, и уровень доверия 95%
+APPROX_SEED = 42
+APPROX_Z = 1.96
+
+# Профилирование: по заголовку X-Profile: 1 (или ?profile=1) с X-Profile-Token
+# и для PROFILE_SAMPLE_RATE процентов всех запросов
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 50))
+PROFILE_TOP = 40
+PROFILE_EXPLAIN_TIMEOUT_MS = 60000
+# Профили ждут EXPLAIN в очереди одного фонового потока; при переполнении новые отбрасываются
+PROFILE_QUEUE_SIZE = 10
+profile_lock = threading.Lock()
+profile_queue = queue.Queue(maxsize=PROFILE_QUEUE_SIZE)
+# Служебные запросы, план которых ничего не говорит о вопросе
+PROFILE_SKIP_SQL = ('pg_export_snapshot', 'to_regclass')
+profile_worker_started = False
+
+# Без прав pg_read_all_stats статус WAL receiver не виден (NULL). Отставание реплики,
+# которая воспроизвела все полученное, считается нулевым: время последней транзакции
+# показывает лишь простой мастера между ночными загрузками
+REPLICA_LAG_SQL = """
+SELECT
+    pg_is_in_recovery(),
+    EXISTS (SELECT 1 FROM pg_stat_wal_receiver) AS has_receiver,
+    (SELECT status FROM pg_stat_wal_receiver LIMIT 1) AS receiver_status,
+    pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() AS caught_up,
+    EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) AS replay_age
+"""
+
+TOTAL_VISITORS_SQL = """
+SELECT SUM(visitors_cnt) as total_visitors
+FROM {source}
+WHERE territory_name LIKE '%Нижний Новгород%'
+"""
+
 def convert_for_json(value):
     """Преобразование значений для json"""
     if value is None or pd.isna(value):
@@ -26,11 +121,97 @@ def convert_for_json(value):
         return value.isoformat()
     return value
 
-def connection_db():
-    """Подключение к базе данных"""
+class Overloaded(Exception):
+    """Бюджет тяжелых запросов исчерпан"""
+
+class QueryLimiter:
+    """Взвешенный лимит одновременно выполняемых тяжелых запросов"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.used = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, weight, wait=ADMISSION_WAIT):
+        """Ожидание свободного бюджета не дольше wait секунд"""
+        weight = min(weight, self.capacity)
+        if weight <= 0:
+            return
+        deadline = time.monotonic() + wait
+        with self.cond:
+            while self.used + weight > self.capacity:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise Overloaded()
+                self.cond.wait(remaining)
+            self.used += weight
+
+    def release(self, weight):
+        weight = min(weight, self.capacity)
+        if weight <= 0:
+            return
+        with self.cond:
+            self.used -= weight
+            self.cond.notify_all()
+
+    @contextmanager
+    def admit(self, weight):
+        self.acquire(weight)
+        try:
+            yield
+        finally:
+            self.release(weight)
+
+heavy_queries = QueryLimiter(HEAVY_QUERY_CAPACITY)
+
+def client_disconnected(sock):
+    """Клиент закрыл соединение: сокет читается, но данных нет"""
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b''
+    except (OSError, ValueError):
+        return True
+
+@contextmanager
+def cancel_on_disconnect(cancel):
+    """Вызов cancel(), если клиент отключился, не дождавшись ответа"""
+    sock = request.environ.get('werkzeug.socket')
+    if sock is None:
+        yield
+        return
+
+    done = threading.Event()
+
+    def watch():
+        while not done.wait(DISCONNECT_POLL):
+            if client_disconnected(sock):
+                cancel()
+                return
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    try:
+        yield
+    finally:
+        done.set()
+        watcher.join()
+
+def error_response(e):
+    """Ответ с ошибкой: перегрузка - 429, превышение времени запроса - 504"""
+    if isinstance(e, Overloaded):
+        return jsonify({'error': 'Сервер перегружен, повторите запрос позже'}), 429, {'Retry-After': str(RETRY_AFTER)}
+    if isinstance(getattr(e, 'orig', e), psycopg2.errors.QueryCanceled):
+        return jsonify({'error': 'Превышено время выполнения запроса'}), 504
+    return jsonify({'error': str(e)}), 500
+
+def connection_db(statement_timeout=None, host=None):
+    """Подключение к базе данных; без host - к мастеру из HOST"""
     
-    host = os.getenv('HOST')
+    replica = host is not None
+    host = host or os.getenv('HOST')
     port = os.getenv('PORT')
+    if host and ':' in host:
+        host, port = host.rsplit(':', 1)
     dbname = os.getenv('DBNAME')
     user = os.getenv('USER')
     password = os.getenv('PASSWORD')
@@ -55,12 +236,422 @@ def connection_db():
         user=user,
         password=password,
         sslmode=sslmode if sslmode else 'disable',
-        sslrootcert=os.path.expanduser('~/.postgresql/root.crt') if sslmode == 'verify-full' else None
+        sslrootcert=os.path.expanduser('~/.postgresql/root.crt') if sslmode == 'verify-full' else None,
+        target_session_attrs='any' if replica else 'read-write',
+        connect_timeout=CONNECT_TIMEOUT
     )
+
+    if statement_timeout:
+        with conn.cursor() as cur:
+            cur.execute("SET statement_timeout = %s", (int(statement_timeout),))
+        conn.commit()
     
     engine = create_engine('postgresql+psycopg2://', creator=lambda: conn)
+    event.listen(engine, 'before_cursor_execute', record_statement)
     return engine
 
+memo_lock = threading.Lock()
+replica_status = {}
+replica_lock = threading.Lock()
+replica_checking = set()
+replica_counter = count()
+
+def check_replica(host):
+    """Проверка доступности и отставания реплики"""
+    status = {'healthy': False, 'lag': None, 'checked': time.monotonic()}
+    try:
+        engine = connection_db(statement_timeout=HEALTH_TIMEOUT_MS, host=host)
+        try:
+            with engine.connect() as conn:
+                row = conn.execute(text(REPLICA_LAG_SQL)).fetchone()
+        finally:
+            engine.dispose()
+        in_recovery, has_receiver, receiver_status, caught_up, replay_age = row
+
+        if not in_recovery:
+            status['error'] = 'Хост не является репликой'
+        elif not has_receiver or receiver_status not in (None, 'streaming'):
+            # Без потоковой репликации равенство LSN не значит, что реплика не отстает
+            status['error'] = f"WAL receiver не получает данные: {receiver_status or 'не запущен'}"
+        else:
+            if caught_up:
+                lag = 0
+            else:
+                lag = replay_age
+            status['lag'] = float(lag) if lag is not None else None
+            status['healthy'] = status['lag'] is not None and status['lag'] <= MAX_REPLICA_LAG
+    except Exception as e:
+        status['error'] = str(e)
+
+    replica_status[host] = status
+    return status
+
+def refresh_replica(host):
+    try:
+        check_replica(host)
+    finally:
+        with replica_lock:
+            replica_checking.discard(host)
+
+def healthy_replicas():
+    """Реплики с допустимым отставанием по последней проверке.
+
+    Устаревшие проверки обновляются в фоне: чтение не ждет подключения
+    к недоступному хосту, а до первой проверки реплика не используется.
+    """
+    now = time.monotonic()
+    with replica_lock:
+        for host in REPLICA_HOSTS:
+            status = replica_status.get(host)
+            if host in replica_checking:
+                continue
+            if status is None or now - status['checked'] > REPLICA_CHECK_INTERVAL:
+                replica_checking.add(host)
+                threading.Thread(target=refresh_replica, args=(host,), daemon=True).start()
+    return [host for host in REPLICA_HOSTS if replica_status.get(host, {}).get('healthy')]
+
+def read_connection_db(statement_timeout=None):
+    """Подключение для чтения: исправная реплика по кругу, иначе мастер.
+    Возвращает (engine, host); host=None - мастер"""
+    replicas = healthy_replicas()
+    start = next(replica_counter)
+    for i in range(len(replicas)):
+        host = replicas[(start + i) % len(replicas)]
+        try:
+            return connection_db(statement_timeout, host=host), host
+        except psycopg2.OperationalError as e:
+            replica_status[host] = {'healthy': False, 'lag': None, 'checked': time.monotonic(), 'error': str(e)}
+    return connection_db(statement_timeout), None
+
+def fetch_rows(conn, sql, params=None, memo=None):
+    """Выполнение запроса; внутри пакета одинаковые запросы выполняются один раз.
+
+    В memo хранится Future на каждый запрос: кто первым занял ключ, тот выполняет
+    запрос, а параллельные вопросы с тем же запросом ждут его результата.
+    """
+    params = params or {}
+    if memo is None:
+        return conn.execute(text(sql), params).fetchall()
+
+    key = (sql, tuple(sorted(params.items())))
+    with memo_lock:
+        future = memo.get(key)
+        owner = future is None
+        if owner:
+            future = memo[key] = Future()
+    if not owner:
+        return future.result()
+
+    try:
+        rows = conn.execute(text(sql), params).fetchall()
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    future.set_result(rows)
+    return rows
+
+def approx_fraction(args):
+    """Доля выборки из параметра approx или None для точного ответа"""
+    raw = args.get('approx')
+    if raw in (None, ''):
+        return None
+    try:
+        fraction = float(raw)
+    except ValueError:
+        fraction = None
+    if fraction is None or not 0 < fraction <= 1:
+        raise ValueError(f"approx должен быть числом в диапазоне (0, 1]: {raw}")
+    return None if fraction == 1 else fraction
+
+def visits_source(args):
+    """Источник строк: вся таблица visits или выборка страниц TABLESAMPLE SYSTEM"""
+    fraction = approx_fraction(args)
+    if fraction is None:
+        return 'visits'
+    return f"visits TABLESAMPLE SYSTEM ({fraction * 100:g}) REPEATABLE ({APPROX_SEED})"
+
+def approx_scale(args):
+    """Множитель 1/f, переводящий суммы и количества по выборке в оценку по всей таблице"""
+    fraction = approx_fraction(args)
+    return 1 if fraction is None else 1 / fraction
+
+def scaled(value, scale):
+    if scale == 1 or value is None:
+        return value
+    return float(value) * scale
+
+def approx_info(args, intervals=True):
+    """Описание точности приближенного ответа; confidence - только если в нем есть интервалы"""
+    fraction = approx_fraction(args)
+    if fraction is None:
+        return None
+    info = {
+        'fraction': fraction,
+        'method': 'TABLESAMPLE SYSTEM'
+    }
+    if intervals:
+        info['confidence'] = 0.95
+    return info
+
+def visitors_errors(conn, args, where, group=None, params=None, memo=None):
+    """Полуширина доверительного интервала суммы visitors_cnt по выборке, по группам group.
+
+    group - выражение или кортеж выражений; ключ результата - значение группы,
+    кортеж значений или None без группировки.
+    SYSTEM выбирает страницы таблицы независимо с вероятностью f, поэтому
+    дисперсия оценки считается по суммам страниц: (1 - f) / f^2 * sum(s^2).
+    """
+    fraction = approx_fraction(args)
+    if fraction is None:
+        return {}
+
+    groups = [group] if isinstance(group, str) else list(group or [])
+    keys = ''.join(f"grp{i}, " for i in range(len(groups)))
+    columns = ''.join(f"{expr} AS grp{i}, " for i, expr in enumerate(groups))
+    sql = f"""
+    SELECT {keys}SUM(s) AS total, SUM(s * s) AS squares
+    FROM (
+        SELECT {columns}(ctid::text::point)[0] AS block, SUM(visitors_cnt) AS s
+        FROM {visits_source(args)}
+        WHERE {where}
+        GROUP BY {keys}block
+    ) blocks
+    """
+    if groups:
+        sql += f"GROUP BY {keys.rstrip(', ')}\n"
+
+    errors = {}
+    for row in fetch_rows(conn, sql, params, memo):
+        if not groups:
+            key = None
+        elif len(groups) == 1:
+            key = row[0]
+        else:
+            key = tuple(row[:len(groups)])
+        errors[key] = APPROX_Z * ((1 - fraction) / fraction ** 2 * float(row[-1] or 0)) ** 0.5
+    return errors
+
+def interval(estimate, error):
+    return [round(max(estimate - error, 0)), round(estimate + error)]
+
+def archive_available(conn, memo=None):
+    """Есть ли архив старых месяцев (его создает load_data.py --archive)"""
+    global archive_exists
+    if not archive_exists:
+        sql = f"SELECT to_regclass('{ARCHIVE_TABLE}') IS NOT NULL"
+        archive_exists = bool(fetch_rows(conn, sql, memo=memo)[0][0])
+    return archive_exists
+
+def rollup_source(conn, args, memo=None):
+    """Строки для ответов за весь период: горячие строки visits (или их выборка)
+    вместе с подневными агрегатами архива.
+
+    Выборка взвешивается 1/f прямо в запросе, а архив учитывается точно. Обе части
+    читаются одним запросом, поэтому перенос месяцев в архив не дает двойного учета.
+    """
+    w = approx_scale(args)
+    weight = '' if w == 1 else f" * {w}"
+    sql = f"""
+        SELECT territory_name, home_country, home_region, home_city, date_of_arrival,
+            visitors_cnt{weight} AS visitors_cnt, 1{weight} AS trips_cnt, spent{weight} AS spent
+        FROM {visits_source(args)}"""
+    if archive_available(conn, memo):
+        sql += f"""
+        UNION ALL
+        SELECT territory_name, home_country, home_region, home_city, date_of_arrival,
+            visitors_cnt, trips_cnt, spent
+        FROM {ARCHIVE_TABLE}"""
+    return f"({sql}\n    ) rollup"
+
+def with_approx(payload, args, intervals=True):
+    """Отметка о точности в ответе, полученном по выборке"""
+    info = approx_info(args, intervals)
+    if info is not None:
+        payload['approx'] = info
+    return payload
+
+def record_statement(conn, cursor, statement, parameters, context, executemany):
+    """Запоминание SQL-запросов профилируемого запроса для EXPLAIN.
+
+    Потоки пакета работают без контекста запроса, поэтому список для них
+    передается через conn.info подключения.
+    """
+    statements = conn.info.get('profile_statements')
+    if statements is None and has_request_context():
+        statements = g.get('profile_statements')
+    if statements is None:
+        return
+    if not statement.lstrip().upper().startswith('SELECT'):
+        return
+    if any(name in statement for name in PROFILE_SKIP_SQL):
+        return
+    dsn = conn.connection.connection.get_dsn_parameters()
+    statements.append({
+        'host': f"{dsn.get('host')}:{dsn.get('port')}",
+        'sql': statement,
+        'params': parameters
+    })
+
+def profile_requested():
+    """Причина профилирования запроса или None"""
+    flag = request.headers.get('X-Profile') or request.args.get('profile')
+    if flag == '1' and PROFILE_TOKEN and request.headers.get('X-Profile-Token') == PROFILE_TOKEN:
+        return 'requested'
+    if PROFILE_SAMPLE_RATE and random.random() * 100 < PROFILE_SAMPLE_RATE:
+        return 'sampled'
+    return None
+
+def explain_statements(statements, weight=0):
+    """EXPLAIN (ANALYZE, BUFFERS) каждого запроса на том же хосте, где он выполнялся.
+
+    EXPLAIN ANALYZE повторно выполняет запрос, поэтому проходит через тот же
+    лимит тяжелых запросов, что и исходный вопрос.
+    """
+    plans = []
+    for item in statements:
+        plan = {'sql': item['sql'], 'params': item['params'], 'host': item['host']}
+        try:
+            with heavy_queries.admit(weight):
+                engine = connection_db(statement_timeout=PROFILE_EXPLAIN_TIMEOUT_MS, host=item['host'])
+                raw = engine.raw_connection()
+                try:
+                    cur = raw.cursor()
+                    cur.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + item['sql'], item['params'])
+                    plan['plan'] = cur.fetchone()[0]
+                    cur.close()
+                finally:
+                    raw.close()
+                    engine.dispose()
+        except Overloaded:
+            plan['error'] = 'EXPLAIN пропущен: сервер перегружен'
+        except Exception as e:
+            plan['error'] = str(e)
+        plans.append(plan)
+    return plans
+
+def save_profile(profile):
+    """Сохранение профиля в кольцевой буфер PROFILE_DIR на PROFILE_KEEP файлов"""
+    profile['statements'] = explain_statements(profile['statements'], profile.pop('weight'))
+
+    with profile_lock:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        endpoint = profile['endpoint'] or 'unknown'
+        filename = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{endpoint}.json"
+        with open(os.path.join(PROFILE_DIR, filename), 'w', encoding='utf-8') as f:
+            json.dump(profile, f, ensure_ascii=False, indent=2, default=str)
+
+        stored = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith('.json'))
+        for name in stored[:-PROFILE_KEEP]:
+            os.remove(os.path.join(PROFILE_DIR, name))
+
+def profile_worker():
+    while True:
+        profile = profile_queue.get()
+        try:
+            save_profile(profile)
+        except Exception:
+            app.logger.exception("Не удалось сохранить профиль %s", profile.get('url'))
+
+def enqueue_profile(profile):
+    global profile_worker_started
+    with profile_lock:
+        if not profile_worker_started:
+            profile_worker_started = True
+            threading.Thread(target=profile_worker, daemon=True).start()
+    try:
+        profile_queue.put_nowait(profile)
+    except queue.Full:
+        # Профилирование не должно копить работу, пока база не успевает
+        pass
+
+@app.before_request
+def start_profile():
+    reason = profile_requested()
+    if reason is None:
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Профилировщик уже работает в другом потоке
+        return
+    g.profiler = profiler
+    g.profile_reason = reason
+    g.profile_started = time.perf_counter()
+    g.profile_statements = []
+
+@app.after_request
+def finish_profile(response):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    if response.is_streamed:
+        # Тело потокового ответа (/api/questions?stream=1, /api/stream) формируется
+        # уже после этой точки, поэтому профиль был бы пустым
+        g.pop('profile_statements', None)
+        return response
+
+    stats_text = io.StringIO()
+    pstats.Stats(profiler, stream=stats_text).sort_stats('cumulative').print_stats(PROFILE_TOP)
+
+    profile = {
+        'timestamp': datetime.now().isoformat(),
+        'endpoint': request.endpoint,
+        'url': request.full_path,
+        'reason': g.profile_reason,
+        'status': response.status_code,
+        'duration_ms': round((time.perf_counter() - g.profile_started) * 1000, 1),
+        'profile': stats_text.getvalue(),
+        'statements': g.pop('profile_statements'),
+        'weight': g.get('profile_weight', 0)
+    }
+    # EXPLAIN ANALYZE повторно выполняет запросы, поэтому ответ клиенту не задерживаем
+    enqueue_profile(profile)
+    return response
+
+@app.teardown_request
+def stop_profile(exc):
+    """Профилировщик выключается, даже если обработка запроса прервалась ошибкой"""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+    g.pop('profile_statements', None)
+
+def profiles_authorized():
+    return bool(PROFILE_TOKEN) and request.headers.get('X-Profile-Token') == PROFILE_TOKEN
+
+@app.route('/api/admin/profiles', methods=['GET'])
+def list_profiles():
+    """Список сохраненных профилей, новые первыми"""
+    if not profiles_authorized():
+        return jsonify({'error': 'Доступ запрещен'}), 403
+
+    profiles = []
+    if os.path.exists(PROFILE_DIR):
+        for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+            if name.endswith('.json'):
+                profiles.append({
+                    'name': name,
+                    'size': os.path.getsize(os.path.join(PROFILE_DIR, name))
+                })
+
+    return jsonify({'profiles': profiles, 'count': len(profiles)})
+
+@app.route('/api/admin/profiles/<name>', methods=['GET'])
+def get_profile(name):
+    """Содержимое сохраненного профиля"""
+    if not profiles_authorized():
+        return jsonify({'error': 'Доступ запрещен'}), 403
+
+    path = os.path.join(PROFILE_DIR, os.path.basename(name))
+    if not name.endswith('.json') or not os.path.exists(path):
+        return jsonify({'error': 'Профиль не найден'}), 404
+
+    with open(path, encoding='utf-8') as f:
+        return jsonify(json.load(f))
+
 @app.route('/', methods=['GET'])
 def home():
     return jsonify({
@@ -69,19 +660,36 @@ def home():
         'endpoints': [
             '/api/question/1', '/api/question/2', '/api/question/3',
             '/api/question/4', '/api/question/5', '/api/question/6',
-            '/api/health', '/api/export'
+            '/api/questions', '/api/stream', '/api/health', '/api/export'
         ]
     })
 
 @app.route('/api/health', methods=['GET'])
 def health():
+    # Состояние реплик - по последней фоновой проверке, чтобы health не ждал недоступный хост
+    healthy_replicas()
+    now = time.monotonic()
+    replicas = {}
+    for host in REPLICA_HOSTS:
+        status = replica_status.get(host)
+        if status is None:
+            replicas[host] = {'healthy': False, 'lag': None, 'error': 'Проверка еще не выполнена'}
+        else:
+            replicas[host] = {key: value for key, value in status.items() if key != 'checked'}
+            replicas[host]['checked_ago'] = round(now - status['checked'], 1)
+
     try:
-        engine = connection_db()
+
+        engine = connection_db(statement_timeout=HEALTH_TIMEOUT_MS)
         with engine.connect() as conn:
             conn.execute(text("SELECT 1"))
         return jsonify({
             'status': 'healthy',
             'database': 'connected',
+            'hosts': {
+                'primary': {'host': os.getenv('HOST'), 'healthy': True},
+                'replicas': replicas
+            },
             'timestamp': datetime.now().isoformat()
         })
     except Exception as e:
@@ -89,540 +697,908 @@ def health():
             'status': 'unhealthy',
             'database': 'disconnected',
             'error': str(e),
+            'hosts': {
+                'primary': {'host': os.getenv('HOST'), 'healthy': False, 'error': str(e)},
+                'replicas': replicas
+            },
             'timestamp': datetime.now().isoformat()
         }), 500
 
-@app.route('/api/question/1', methods=['GET'])
-def question_1():
-    try:
-        engine = connection_db()
-        
-        query = """
-        SELECT SUM(visitors_cnt) as total_visitors
-        FROM visits
-        WHERE territory_name LIKE '%Нижний Новгород%'
-        """
-        
-        with engine.connect() as conn:
-            result = conn.execute(text(query))
-            row = result.fetchone()
-            
-        total = convert_for_json(row[0]) if row and row[0] else 0
-        if total is None:
-            total = 0
-            
-        return jsonify({
-            'question': 'Сколько туристов посетило Нижний Новгород за весь диапазон дат?',
-            'answer': {
-                'total_visitors': total,
-                'total_visitors_formatted': f"{total:,} человек"
-            }
-        })
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+def answer_question_1(conn, args, memo=None):
+    """Общее количество туристов за весь период"""
+    rows = fetch_rows(conn, TOTAL_VISITORS_SQL.format(source=rollup_source(conn, args, memo)), memo=memo)
+    row = rows[0] if rows else None
 
-@app.route('/api/question/2', methods=['GET'])
-def question_2():
-    try:
-        start = request.args.get('start_date')
-        end = request.args.get('end_date')
-        
-        engine = connection_db()
-        
-        sql = """
-        SELECT 
-            TO_CHAR(date_of_arrival, 'YYYY-MM') as month,
+    total = convert_for_json(row[0]) if row and row[0] else 0
+    if total is None:
+        total = 0
+    total = round(total)
+
+    answer = {
+        'total_visitors': total,
+        'total_visitors_formatted': f"{total:,} человек"
+    }
+    errors = visitors_errors(conn, args, "territory_name LIKE '%Нижний Новгород%'", memo=memo)
+    if approx_fraction(args) is not None:
+        answer['total_visitors_ci'] = interval(total, errors.get(None, 0))
+
+    return with_approx({
+        'question': 'Сколько туристов посетило Нижний Новгород за весь диапазон дат?',
+        'answer': answer
+    }, args)
+
+def answer_question_2(conn, args, memo=None):
+    """Помесячная динамика посещаемости"""
+    start = args.get('start_date')
+    end = args.get('end_date')
+    source = rollup_source(conn, args, memo)
+    where = "territory_name LIKE '%Нижний Новгород%'"
+
+    sql = f"""
+    SELECT
+        TO_CHAR(date_of_arrival, 'YYYY-MM') as month,
+        SUM(visitors_cnt) as visitors,
+        SUM(trips_cnt) as trips,
+        SUM(spent) as spent
+    FROM {source}
+    WHERE territory_name LIKE '%Нижний Новгород%'
+    """
+
+    params = {}
+    if start and end:
+        sql += " AND date_of_arrival BETWEEN :start AND :end"
+        where += " AND date_of_arrival BETWEEN :start AND :end"
+        params['start'] = start
+        params['end'] = end
+        period = f"с {start} по {end}"
+    else:
+        period = "за весь период"
+
+    sql += " GROUP BY month ORDER BY month"
+
+    rows = fetch_rows(conn, sql, params, memo)
+    approx = approx_fraction(args) is not None
+    errors = visitors_errors(conn, args, where, "TO_CHAR(date_of_arrival, 'YYYY-MM')", params, memo)
+
+    months = []
+    for row in rows:
+        spent = (convert_for_json(row[3]) or 0) * 1_000_000
+        month = {
+            'month': row[0],
+            'visitors': round(convert_for_json(row[1]) or 0),
+            'trips': round(convert_for_json(row[2]) or 0),
+            'spent': round(spent, 0)
+        }
+        if approx:
+            month['visitors_ci'] = interval(month['visitors'], errors.get(row[0], 0))
+        months.append(month)
+
+    total = None
+    if start and end:
+        sql_total = f"""
+        SELECT
             SUM(visitors_cnt) as visitors,
-            COUNT(*) as trips,
             SUM(spent) as spent
-        FROM visits
+        FROM {source}
         WHERE territory_name LIKE '%Нижний Новгород%'
+            AND date_of_arrival BETWEEN :start AND :end
         """
-        
-        params = {}
-        if start and end:
-            sql += " AND date_of_arrival BETWEEN :start AND :end"
-            params['start'] = start
-            params['end'] = end
-            period = f"с {start} по {end}"
-        else:
-            period = "за весь период"
-        
-        sql += " GROUP BY month ORDER BY month"
-        
-        with engine.connect() as conn:
-            res = conn.execute(text(sql), params)
-            rows = res.fetchall()
-        
-        months = []
-        for row in rows:
-            spent = (convert_for_json(row[3]) or 0) * 1_000_000
-            months.append({
-                'month': row[0],
-                'visitors': convert_for_json(row[1]) or 0,
-                'trips': convert_for_json(row[2]) or 0,
-                'spent': round(spent, 0)
-            })
-        
-        total = None
-        if start and end:
-            sql_total = """
-            SELECT 
-                SUM(visitors_cnt) as visitors,
-                SUM(spent) as spent
-            FROM visits
-            WHERE territory_name LIKE '%Нижний Новгород%'
-                AND date_of_arrival BETWEEN :start AND :end
-            """
-            
+
+        row = fetch_rows(conn, sql_total, params, memo)[0]
+
+        spent = (convert_for_json(row[1]) or 0) * 1_000_000
+        total = {
+            'visitors': round(convert_for_json(row[0]) or 0),
+            'spent': round(spent, 0)
+        }
+        if approx:
+            error = visitors_errors(conn, args, where, params=params, memo=memo).get(None, 0)
+            total['visitors_ci'] = interval(total['visitors'], error)
+
+    return with_approx({
+        'question': 'Сколько туристов посещало Нижний Новгород каждый месяц?',
+        'period': period,
+        'answer': {
+            'months': months,
+            'total': total,
+            'count': len(months)
+        }
+    }, args)
+
+def answer_question_3(conn, args, memo=None):
+    """Территориальное распределение туристов"""
+    source = rollup_source(conn, args, memo)
+
+    query = f"""
+    SELECT
+        home_country,
+        home_region,
+        home_city,
+        SUM(visitors_cnt) AS total_visitors,
+        SUM(trips_cnt) AS trips_count,
+        SUM(spent) AS total_spent
+    FROM
+        {source}
+    WHERE
+        territory_name LIKE '%Нижний Новгород%'
+        AND home_country != 'неизвестно'
+    GROUP BY
+        home_country,
+        home_region,
+        home_city
+    ORDER BY
+        total_visitors DESC
+    """
+
+    rows = fetch_rows(conn, query, memo=memo)
+    approx = approx_fraction(args) is not None
+    # Архив учитывается точно, ошибку дает только выборка горячих строк
+    errors = visitors_errors(
+        conn, args,
+        "territory_name LIKE '%Нижний Новгород%' AND home_country != 'неизвестно'",
+        ('home_country', 'home_region', 'home_city'), memo=memo
+    )
+
+    # Тот же запрос, что и в вопросе 1: в пакете выполняется один раз
+    total_all = float(convert_for_json(fetch_rows(conn, TOTAL_VISITORS_SQL.format(source=source), memo=memo)[0][0]) or 1)
+
+    countries = {}
+    regions = []
+
+    for row in rows:
+        country = convert_for_json(row[0])
+        region = convert_for_json(row[1])
+        city = convert_for_json(row[2])
+        visitors = round(convert_for_json(row[3]) or 0)
+        trips = round(convert_for_json(row[4]) or 0)
+        spent = (convert_for_json(row[5]) or 0) * 1_000_000
+
+        if country:
+            countries[country] = countries.get(country, 0) + visitors
+
+        percent = (visitors / total_all * 100) if total_all else 0
+
+        item = {
+            'country': country,
+            'region': region,
+            'city': city,
+            'visitors': visitors,
+            'trips': trips,
+            'spent': round(spent, 2),
+            'percent': round(percent, 2)
+        }
+        if approx:
+            item['visitors_ci'] = interval(visitors, errors.get((row[0], row[1], row[2]), 0))
+        regions.append(item)
+
+    summary = "Территориальное распределение: "
+    if regions:
+        main = regions[0]
+        summary += f"больше всего из {main['region']} ({main['percent']}%)"
+    else:
+        summary += "нет данных"
+
+    return with_approx({
+        'question': 'Как представлено территориальное распределение туристов?',
+        'answer': {
+            'total': len(regions),
+            'countries': countries,
+            'regions': regions,
+            'summary': summary
+        }
+    }, args)
+
+def answer_question_4(conn, args, memo=None):
+    """Демографическое распределение туристов"""
+    source = visits_source(args)
+    scale = approx_scale(args)
+
+    age_q = f"""
+    SELECT
+        age,
+        SUM(visitors_cnt) AS visitors,
+        COUNT(*) AS trips,
+        SUM(spent) AS spent
+    FROM
+        {source}
+    WHERE
+        territory_name LIKE '%Нижний Новгород%'
+        AND age != 'неизвестно'
+    GROUP BY
+        age
+    ORDER BY
+        CASE
+            WHEN age LIKE 'до%' THEN 1
+            WHEN age LIKE 'от 18%' THEN 2
+            WHEN age LIKE 'от 25%' THEN 3
+            WHEN age LIKE 'от 35%' THEN 4
+            WHEN age LIKE 'от 45%' THEN 5
+            WHEN age LIKE 'от 55%' THEN 6
+            WHEN age LIKE 'старше%' THEN 7
+            ELSE 8
+        END
+    """
+
+    gender_q = f"""
+    SELECT
+        gender,
+        SUM(visitors_cnt) AS visitors,
+        COUNT(*) AS trips,
+        SUM(spent) AS spent
+    FROM
+        {source}
+    WHERE
+        territory_name LIKE '%Нижний Новгород%'
+        AND gender != 'неизвестно'
+    GROUP BY
+        gender
+    """
+
+    age_rows = fetch_rows(conn, age_q, memo=memo)
+    gender_rows = fetch_rows(conn, gender_q, memo=memo)
+    approx = approx_fraction(args) is not None
+    age_errors = visitors_errors(
+        conn, args, "territory_name LIKE '%Нижний Новгород%' AND age != 'неизвестно'", 'age', memo=memo
+    )
+    gender_errors = visitors_errors(
+        conn, args, "territory_name LIKE '%Нижний Новгород%' AND gender != 'неизвестно'", 'gender', memo=memo
+    )
+
+    total = 0
+    for row in age_rows:
+        total += scaled(convert_for_json(row[1]) or 0, scale)
+
+    ages = []
+    for row in age_rows:
+        visitors = round(scaled(convert_for_json(row[1]) or 0, scale))
+        percent = (visitors / total * 100) if total > 0 else 0
+        spent = scaled((convert_for_json(row[3]) or 0) * 1_000_000, scale)
+
+        item = {
+            'group': convert_for_json(row[0]),
+            'visitors': visitors,
+            'trips': round(scaled(convert_for_json(row[2]) or 0, scale)),
+            'spent': round(spent, 2),
+            'percent': round(percent, 2)
+        }
+        if approx:
+            item['visitors_ci'] = interval(visitors, age_errors.get(row[0], 0))
+        ages.append(item)
+
+    genders = []
+    for row in gender_rows:
+        visitors = round(scaled(convert_for_json(row[1]) or 0, scale))
+        spent = scaled((convert_for_json(row[3]) or 0) * 1_000_000, scale)
+        item = {
+            'gender': convert_for_json(row[0]),
+            'visitors': visitors,
+            'trips': round(scaled(convert_for_json(row[2]) or 0, scale)),
+            'spent': round(spent, 2)
+        }
+        if approx:
+            item['visitors_ci'] = interval(visitors, gender_errors.get(row[0], 0))
+        genders.append(item)
+
+    summary = "Преобладают туристы "
+
+    if ages:
+        summary += f"{ages[0]['group']}"
+    if genders:
+        summary += f", пол: {genders[0]['gender']}"
+
+    return with_approx({
+        'question': 'Как представлено демографическое распределение туристов?',
+        'answer': {
+            'ages': ages,
+            'genders': genders,
+            'summary': summary
+        }
+    }, args)
+
+def answer_question_5(conn, args, memo=None):
+    """Наиболее выгодные категории туристов"""
+    source = visits_source(args)
+    scale = approx_scale(args)
+
+    ai_q = f"""
+    SELECT
+        age,
+        income,
+        COUNT(*) AS trips,
+        SUM(visitors_cnt) AS visitors,
+        SUM(spent) AS spent,
+        AVG(days_cnt) AS days,
+        AVG(spent / NULLIF(visitors_cnt, 0)) AS spent_person
+    FROM
+        {source}
+    WHERE
+        territory_name LIKE '%Нижний Новгород%'
+        AND age != 'неизвестно'
+        AND income != 'неизвестно'
+    GROUP BY
+        age, income
+    ORDER BY
+        spent_person DESC NULLS LAST
+    LIMIT 10
+    """
+
+    goal_q = f"""
+    SELECT
+        goal,
+        COUNT(*) AS trips,
+        SUM(visitors_cnt) AS visitors,
+        SUM(spent) AS spent,
+        AVG(days_cnt) AS days,
+        AVG(spent / NULLIF(visitors_cnt, 0)) AS spent_person
+    FROM
+        {source}
+    WHERE
+        territory_name LIKE '%Нижний Новгород%'
+        AND goal != 'неизвестно'
+    GROUP BY
+        goal
+    ORDER BY
+        spent_person DESC NULLS LAST
+    """
+
+    ai_rows = fetch_rows(conn, ai_q, memo=memo)
+    goal_rows = fetch_rows(conn, goal_q, memo=memo)
+    approx = approx_fraction(args) is not None
+    ai_errors = visitors_errors(
+        conn, args,
+        "territory_name LIKE '%Нижний Новгород%' AND age != 'неизвестно' AND income != 'неизвестно'",
+        ('age', 'income'), memo=memo
+    )
+    goal_errors = visitors_errors(
+        conn, args, "territory_name LIKE '%Нижний Новгород%' AND goal != 'неизвестно'", 'goal', memo=memo
+    )
+
+    ai_list = []
+    for row in ai_rows:
+        spent = scaled((convert_for_json(row[4]) or 0) * 1_000_000, scale)
+        spent_person = (convert_for_json(row[6]) or 0) * 1_000_000
+
+        item = {
+            'age': convert_for_json(row[0]),
+            'income': convert_for_json(row[1]),
+            'trips': round(scaled(convert_for_json(row[2]) or 0, scale)),
+            'visitors': round(scaled(convert_for_json(row[3]) or 0, scale)),
+            'spent_rub': round(spent, 0),
+            'days': round(convert_for_json(row[5]) or 0, 1),
+            'spent_person': round(spent_person, 0)
+        }
+        if approx:
+            item['visitors_ci'] = interval(item['visitors'], ai_errors.get((row[0], row[1]), 0))
+        ai_list.append(item)
+
+    goals = []
+    for row in goal_rows:
+        spent = scaled((convert_for_json(row[3]) or 0) * 1_000_000, scale)
+        spent_person = (convert_for_json(row[5]) or 0) * 1_000_000
+
+        item = {
+            'goal': convert_for_json(row[0]),
+            'trips': round(scaled(convert_for_json(row[1]) or 0, scale)),
+            'visitors': round(scaled(convert_for_json(row[2]) or 0, scale)),
+            'spent': round(spent, 0),
+            'days': round(convert_for_json(row[4]) or 0, 1),
+            'spent_person': round(spent_person, 0)
+        }
+        if approx:
+            item['visitors_ci'] = interval(item['visitors'], goal_errors.get(row[0], 0))
+        goals.append(item)
+
+    best = ai_list[0] if ai_list else None
+
+    recs = []
+    if best:
+        recs.append(f"Ориентироваться на {best['age']} с доходом {best['income']}")
+        recs.append(f"Тратят на человека: {best['spent_person']:,.0f} руб.")
+        if goals:
+            recs.append(f"Цель: {goals[0]['goal']}")
+
+    return with_approx({
+        'question': 'Под какую категорию туристов выгоднее всего планировать мероприятия?',
+        'answer': {
+            'age_income': ai_list,
+            'goals': goals,
+            'best': best,
+            'recs': recs
+        }
+    }, args)
+
+def answer_question_6(conn, args, memo=None):
+    """Профиль среднестатистического туриста"""
+    # Здесь только средние, медианы и моды: по выборке они не масштабируются
+    source = visits_source(args)
+
+    avg_q = f"""
+    SELECT
+        AVG(days_cnt) AS avg_days,
+        AVG(visitors_cnt) AS avg_group,
+        AVG(spent) AS avg_trip,
+        AVG(spent / NULLIF(visitors_cnt, 0)) AS avg_person,
+        PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY days_cnt) AS med_days,
+        PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY spent / NULLIF(visitors_cnt, 0)) AS med_person
+    FROM {source}
+    WHERE territory_name LIKE '%Нижний Новгород%'
+    """
+
+    # Моды всех категорий за один проход: каждая строка результата - одно
+    # значение одной колонки, GROUPING показывает, по какой колонке группа
+    mode_columns = ['age', 'gender', 'income', 'goal', 'trip_type', 'home_region', 'home_city']
+    modes_q = f"""
+    SELECT
+        {', '.join(mode_columns)},
+        COUNT(*) AS cnt,
+        GROUPING({', '.join(mode_columns)}) AS grouping_mask
+    FROM {source}
+    WHERE territory_name LIKE '%Нижний Новгород%'
+    GROUP BY GROUPING SETS ({', '.join(f'({c})' for c in mode_columns)})
+    """
+
+    avg_rows = fetch_rows(conn, avg_q, memo=memo)
+    avg = avg_rows[0] if avg_rows else None
+
+    modes = {}
+    counts = {}
+    for row in fetch_rows(conn, modes_q, memo=memo):
+        mask = row[-1]
+        for i, c in enumerate(mode_columns):
+            # Бит колонки равен 0, если группировка шла по ней
+            if mask & (1 << (len(mode_columns) - 1 - i)):
+                continue
+            value = row[i]
+            if value is None or value == 'неизвестно':
+                continue
+            if row[-2] > counts.get(c, 0):
+                modes[c] = (value,)
+                counts[c] = row[-2]
+
+    age = modes.get('age')
+    gender = modes.get('gender')
+    income = modes.get('income')
+    goal = modes.get('goal')
+    trip = modes.get('trip_type')
+    region = modes.get('home_region')
+    city = modes.get('home_city')
+
+    def get(row, default=None):
+        if row is not None and len(row) > 0 and row[0] is not None:
+            return convert_for_json(row[0])
+        return default
+
+    age = get(age, 'не указан')
+    gender = get(gender, 'человек')
+    income = get(income, 'не указан')
+    goal = get(goal, 'разные цели')
+    trip_type = get(trip, 'разные')
+    region = get(region, 'разных регионов')
+    city = get(city, 'не указан')
+
+    trip = (convert_for_json(avg[2]) or 0) * 1_000_000
+    person = (convert_for_json(avg[3]) or 0) * 1_000_000
+    med_person = (convert_for_json(avg[5]) or 0) * 1_000_000 if len(avg) > 5 else 0
+
+    desc = f"Профиль туриста: {gender} в возрасте {age}, "
+    desc += f"с доходом {income}. Приезжает из {region} "
+    desc += f"(город {city}). Цель - {goal}, "
+    desc += f"тип поездки - {trip_type}. Останавливается на {round(convert_for_json(avg[0]) or 0, 1)} дней, "
+    desc += f"группа {round(convert_for_json(avg[1]) or 0, 1)} чел. Тратит за поездку {round(trip, 0):,.0f} руб "
+    desc += f"({round(person, 0):,.0f} руб./чел)."
+
+    return with_approx({
+        'question': 'Как выглядит профиль среднестатистического туриста?',
+        'answer': {
+            'numbers': {
+                'days': round(convert_for_json(avg[0]) or 0, 1),
+                'group': round(convert_for_json(avg[1]) or 0, 1),
+                'trip': round(trip, 0),
+                'person': round(person, 0),
+                'med_days': convert_for_json(avg[4]) if len(avg) > 4 else None,
+                'med_person': round(med_person, 0) if len(avg) > 5 else None
+            },
+            'categories': {
+                'age': age,
+                'gender': gender,
+                'income': income,
+                'goal': goal,
+                'trip': trip_type,
+                'region': region,
+                'city': city
+            },
+            'text': desc
+        }
+    }, args, intervals=False)
+
+QUESTIONS = {
+    1: answer_question_1,
+    2: answer_question_2,
+    3: answer_question_3,
+    4: answer_question_4,
+    5: answer_question_5,
+    6: answer_question_6,
+}
+
+answer_cache = {}
+cache_lock = threading.Lock()
+subscribers = []
+subscribers_lock = threading.Lock()
+# Кеш используется, только пока работает LISTEN, иначе он мог бы устареть
+listener_ready = threading.Event()
+listener_started = False
+last_load_notify = 0.0
+# Растет с каждой загрузкой: ответ, начатый до нее, в кеш не попадает
+load_generation = 0
+
+def cache_key(q_id, args):
+    return q_id, tuple(sorted((key, value) for key, value in args.items() if key != 'profile'))
+
+def answer_period(args):
+    """Диапазон дат ответа (start, end) или None, если ответ за весь период"""
+    try:
+        start = datetime.strptime(args.get('start_date', ''), '%Y-%m-%d').date()
+        end = datetime.strptime(args.get('end_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return None
+    return start, end
+
+def cache_answer(q_id, args, payload, generation):
+    # Без LISTEN уведомление о загрузке не дошло бы, и ответ устарел бы незаметно
+    if not listener_ready.is_set():
+        return
+    with cache_lock:
+        if generation != load_generation:
+            return
+        if len(answer_cache) >= ANSWER_CACHE_SIZE:
+            answer_cache.pop(next(iter(answer_cache)))
+        answer_cache[cache_key(q_id, args)] = {
+            'payload': payload,
+            # Диапазон дат учитывает только вопрос 2, остальные ответы за весь период
+            'period': answer_period(args) if q_id == 2 else None
+        }
+
+def cached_answer(q_id, args):
+    if not listener_ready.is_set():
+        return None
+    with cache_lock:
+        entry = answer_cache.get(cache_key(q_id, args))
+    return entry['payload'] if entry else None
+
+def invalidate_answers(min_date, max_date):
+    """Сброс ответов, которые затрагивает загруженный диапазон дат; возвращает номера вопросов"""
+    questions = set()
+    with cache_lock:
+        for key, entry in list(answer_cache.items()):
+            period = entry['period']
+            if period is None or (period[0] <= max_date and min_date <= period[1]):
+                del answer_cache[key]
+                questions.add(key[0])
+    return sorted(questions)
+
+def publish(event_type, data):
+    """Отправка события всем подписчикам /api/stream"""
+    with subscribers_lock:
+        for q in subscribers:
+            try:
+                q.put_nowait((event_type, data))
+            except queue.Full:
+                # Медленный клиент пропустит событие, но не задержит остальных
+                pass
+
+def handle_load(payload):
+    global last_load_notify, load_generation
+    min_date = datetime.strptime(payload['min_date'], '%Y-%m-%d').date()
+    max_date = datetime.strptime(payload['max_date'], '%Y-%m-%d').date()
+    with cache_lock:
+        load_generation += 1
+        last_load_notify = time.monotonic()
+    payload['invalidated'] = invalidate_answers(min_date, max_date)
+    publish('load', payload)
+
+def listen_loads():
+    """Одно подключение LISTEN к мастеру: сброс кеша и события о загрузках"""
+    global load_generation
+    while True:
+        conn = None
+        try:
+            engine = connection_db()
+            raw = engine.raw_connection()
+            conn = raw.connection
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {LOAD_CHANNEL}")
+            # Загрузки, прошедшие до LISTEN, не были услышаны: ответы, посчитанные
+            # или начатые до этого момента, в кеш не попадают
+            with cache_lock:
+                answer_cache.clear()
+                load_generation += 1
+            listener_ready.set()
+
+            while True:
+                readable, _, _ = select.select([conn], [], [], LISTEN_POLL)
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        handle_load(json.loads(notify.payload))
+                    except (ValueError, KeyError):
+                        continue
+                if not readable:
+                    # Проверка, что подключение живо, между уведомлениями
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+        except Exception:
+            # Уведомления могли потеряться, поэтому кеш больше не надежен
+            listener_ready.clear()
+            with cache_lock:
+                answer_cache.clear()
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            time.sleep(LISTEN_RETRY)
+
+def ensure_listener():
+    global listener_started
+    with subscribers_lock:
+        if listener_started:
+            return
+        listener_started = True
+    threading.Thread(target=listen_loads, daemon=True).start()
+
+def question_response(q_id):
+    """Ответ на отдельный вопрос"""
+    budget = QUERY_BUDGETS[q_id]
+    g.profile_weight = budget['weight']
+    try:
+        approx_fraction(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    ensure_listener()
+    payload = None if g.get('profiler') else cached_answer(q_id, request.args)
+    if payload is not None:
+        return jsonify(payload)
+
+    try:
+        generation = load_generation
+        with heavy_queries.admit(budget['weight']):
+            engine, host = read_connection_db(statement_timeout=budget['timeout_ms'])
             with engine.connect() as conn:
-                res = conn.execute(text(sql_total), params)
-                row = res.fetchone()
-            
-            spent = (convert_for_json(row[1]) or 0) * 1_000_000
-            total = {
-                'visitors': convert_for_json(row[0]) or 0,
-                'spent': round(spent, 0)
-            }
-        
-        return jsonify({
-            'question': 'Сколько туристов посещало Нижний Новгород каждый месяц?',
-            'period': period,
-            'answer': {
-                'months': months,
-                'total': total,
-                'count': len(months)
-            }
-        })
-        
+                with cancel_on_disconnect(conn.connection.connection.cancel):
+                    payload = QUESTIONS[q_id](conn, request.args)
+        # Сразу после загрузки реплика может еще не содержать новых строк
+        if host is None or time.monotonic() - last_load_notify > MAX_REPLICA_LAG:
+            cache_answer(q_id, request.args, payload, generation)
+        return jsonify(payload)
+
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
+
+@app.route('/api/question/1', methods=['GET'])
+def question_1():
+    return question_response(1)
+
+@app.route('/api/question/2', methods=['GET'])
+def question_2():
+    return question_response(2)
 
 @app.route('/api/question/3', methods=['GET'])
 def question_3():
-    try:
-        engine = connection_db()
-        
-        query = """
-        SELECT 
-            home_country,
-            home_region,
-            home_city,
-            SUM(visitors_cnt) AS total_visitors,
-            COUNT(*) AS trips_count,
-            SUM(spent) AS total_spent
-        FROM 
-            visits
-        WHERE 
-            territory_name LIKE '%Нижний Новгород%'
-            AND home_country != 'неизвестно'
-        GROUP BY 
-            home_country,
-            home_region,
-            home_city
-        ORDER BY 
-            total_visitors DESC
-        """
-        
-        with engine.connect() as conn:
-            res = conn.execute(text(query))
-            rows = res.fetchall()
-        
-        total_query = """
-        SELECT SUM(visitors_cnt) 
-        FROM visits 
-        WHERE territory_name LIKE '%Нижний Новгород%'
-        """
-        with engine.connect() as conn:
-            total_res = conn.execute(text(total_query))
-            total_all = convert_for_json(total_res.fetchone()[0]) or 1
-        
-        countries = {}
-        regions = []
-        
-        for row in rows:
-            country = convert_for_json(row[0])
-            region = convert_for_json(row[1])
-            city = convert_for_json(row[2])
-            visitors = convert_for_json(row[3]) or 0
-            trips = convert_for_json(row[4]) or 0
-            spent = (convert_for_json(row[5]) or 0) * 1_000_000
-            
-            if country:
-                countries[country] = countries.get(country, 0) + visitors
-            
-            percent = (visitors / total_all * 100) if total_all else 0
-            
-            regions.append({
-                'country': country,
-                'region': region,
-                'city': city,
-                'visitors': visitors,
-                'trips': trips,
-                'spent': round(spent, 2),
-                'percent': round(percent, 2)
-            })
-        
-        summary = "Территориальное распределение: "
-        if regions:
-            main = regions[0]
-            summary += f"больше всего из {main['region']} ({main['percent']}%)"
-        else:
-            summary += "нет данных"
-        
-        return jsonify({
-            'question': 'Как представлено территориальное распределение туристов?',
-            'answer': {
-                'total': len(regions),
-                'countries': countries,
-                'regions': regions,
-                'summary': summary
-            }
-        })
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return question_response(3)
 
 @app.route('/api/question/4', methods=['GET'])
 def question_4():
-    try:
-        engine = connection_db()
-        
-        age_q = """
-        SELECT 
-            age,
-            SUM(visitors_cnt) AS visitors,
-            COUNT(*) AS trips,
-            SUM(spent) AS spent
-        FROM 
-            visits
-        WHERE 
-            territory_name LIKE '%Нижний Новгород%'
-            AND age != 'неизвестно'
-        GROUP BY 
-            age
-        ORDER BY 
-            CASE 
-                WHEN age LIKE 'до%' THEN 1
-                WHEN age LIKE 'от 18%' THEN 2
-                WHEN age LIKE 'от 25%' THEN 3
-                WHEN age LIKE 'от 35%' THEN 4
-                WHEN age LIKE 'от 45%' THEN 5
-                WHEN age LIKE 'от 55%' THEN 6
-                WHEN age LIKE 'старше%' THEN 7
-                ELSE 8
-            END
-        """
-        
-        gender_q = """
-        SELECT 
-            gender,
-            SUM(visitors_cnt) AS visitors,
-            COUNT(*) AS trips,
-            SUM(spent) AS spent
-        FROM 
-            visits
-        WHERE 
-            territory_name LIKE '%Нижний Новгород%'
-            AND gender != 'неизвестно'
-        GROUP BY 
-            gender
-        """
-        
-        with engine.connect() as conn:
-            age_res = conn.execute(text(age_q))
-            age_rows = age_res.fetchall()
-            
-            gender_res = conn.execute(text(gender_q))
-            gender_rows = gender_res.fetchall()
-        
-        total = 0
-        for row in age_rows:
-            total += convert_for_json(row[1]) or 0
-        
-        ages = []
-        for row in age_rows:
-            visitors = convert_for_json(row[1]) or 0
-            percent = (visitors / total * 100) if total > 0 else 0
-            spent = (convert_for_json(row[3]) or 0) * 1_000_000
-            
-            ages.append({
-                'group': convert_for_json(row[0]),
-                'visitors': visitors,
-                'trips': convert_for_json(row[2]) or 0,
-                'spent': round(spent, 2),
-                'percent': round(percent, 2)
-            })
-        
-        genders = []
-        for row in gender_rows:
-            visitors = convert_for_json(row[1]) or 0
-            spent = (convert_for_json(row[3]) or 0) * 1_000_000
-            genders.append({
-                'gender': convert_for_json(row[0]),
-                'visitors': visitors,
-                'trips': convert_for_json(row[2]) or 0,
-                'spent': round(spent, 2)
-            })
-        
-        summary = "Преобладают туристы "
-        
-        if ages:
-            summary += f"{ages[0]['group']}"
-        if genders:
-            summary += f", пол: {genders[0]['gender']}"
-        
-        return jsonify({
-            'question': 'Как представлено демографическое распределение туристов?',
-            'answer': {
-                'ages': ages,
-                'genders': genders,
-                'summary': summary
-            }
-        })
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return question_response(4)
 
 @app.route('/api/question/5', methods=['GET'])
 def question_5():
-    try:
-        engine = connection_db()
-        
-        ai_q = """
-        SELECT 
-            age,
-            income,
-            COUNT(*) AS trips,
-            SUM(visitors_cnt) AS visitors,
-            SUM(spent) AS spent,
-            AVG(days_cnt) AS days,
-            AVG(spent / NULLIF(visitors_cnt, 0)) AS spent_person
-        FROM 
-            visits
-        WHERE 
-            territory_name LIKE '%Нижний Новгород%'
-            AND age != 'неизвестно'
-            AND income != 'неизвестно'
-        GROUP BY 
-            age, income
-        ORDER BY 
-            spent_person DESC NULLS LAST
-        LIMIT 10
-        """
-        
-        goal_q = """
-        SELECT 
-            goal,
-            COUNT(*) AS trips,
-            SUM(visitors_cnt) AS visitors,
-            SUM(spent) AS spent,
-            AVG(days_cnt) AS days,
-            AVG(spent / NULLIF(visitors_cnt, 0)) AS spent_person
-        FROM 
-            visits
-        WHERE 
-            territory_name LIKE '%Нижний Новгород%'
-            AND goal != 'неизвестно'
-        GROUP BY 
-            goal
-        ORDER BY 
-            spent_person DESC NULLS LAST
-        """
-        
-        with engine.connect() as conn:
-            ai_res = conn.execute(text(ai_q))
-            ai_rows = ai_res.fetchall()
-            
-            goal_res = conn.execute(text(goal_q))
-            goal_rows = goal_res.fetchall()
-        
-        ai_list = []
-        for row in ai_rows:
-            spent = (convert_for_json(row[4]) or 0) * 1_000_000
-            spent_person = (convert_for_json(row[6]) or 0) * 1_000_000
-            
-            ai_list.append({
-                'age': convert_for_json(row[0]),
-                'income': convert_for_json(row[1]),
-                'trips': convert_for_json(row[2]) or 0,
-                'visitors': convert_for_json(row[3]) or 0,
-                'spent_rub': round(spent, 0),
-                'days': round(convert_for_json(row[5]) or 0, 1),
-                'spent_person': round(spent_person, 0)
-            })
-        
-        goals = []
-        for row in goal_rows:
-            spent = (convert_for_json(row[3]) or 0) * 1_000_000
-            spent_person = (convert_for_json(row[5]) or 0) * 1_000_000
-            
-            goals.append({
-                'goal': convert_for_json(row[0]),
-                'trips': convert_for_json(row[1]) or 0,
-                'visitors': convert_for_json(row[2]) or 0,
-                'spent': round(spent, 0),
-                'days': round(convert_for_json(row[4]) or 0, 1),
-                'spent_person': round(spent_person, 0)
-            })
-        
-        best = ai_list[0] if ai_list else None
-        
-        recs = []
-        if best:
-            recs.append(f"Ориентироваться на {best['age']} с доходом {best['income']}")
-            recs.append(f"Тратят на человека: {best['spent_person']:,.0f} руб.")
-            if goals:
-                recs.append(f"Цель: {goals[0]['goal']}")
-        
-        return jsonify({
-            'question': 'Под какую категорию туристов выгоднее всего планировать мероприятия?',
-            'answer': {
-                'age_income': ai_list,
-                'goals': goals,
-                'best': best,
-                'recs': recs
-            }
-        })
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return question_response(5)
 
 @app.route('/api/question/6', methods=['GET'])
 def question_6():
+    return question_response(6)
+
+def parse_question_ids(raw):
+    """Разбор параметра ids=1,2,4; без параметра - все вопросы"""
+    if not raw:
+        return list(QUESTIONS)
+
+    ids = []
+    for part in raw.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if not part.isdigit() or int(part) not in QUESTIONS:
+            raise ValueError(f"Неизвестный вопрос: {part}")
+        if int(part) not in ids:
+            ids.append(int(part))
+    return ids
+
+def begin_snapshot(engine, snapshot=None):
+    """Транзакция REPEATABLE READ; с snapshot - на снимке другой транзакции"""
+    conn = engine.connect().execution_options(isolation_level='REPEATABLE READ')
+    trans = conn.begin()
+    if snapshot:
+        conn.execute(text(f"SET TRANSACTION SNAPSHOT '{snapshot}'"))
+    return conn, trans
+
+def answer_questions(conn, ids, args, memo):
+    """Ответы на вопросы в одной транзакции по мере готовности"""
+    for q_id in ids:
+        # Ошибка одного вопроса не должна прерывать всю транзакцию
+        savepoint = conn.begin_nested()
+        try:
+            payload = QUESTIONS[q_id](conn, args, memo)
+            savepoint.commit()
+        except Exception as e:
+            savepoint.rollback()
+            payload = {'error': str(e)}
+        yield q_id, payload
+
+def pending_ids(pending):
+    while True:
+        try:
+            yield pending.get_nowait()
+        except queue.Empty:
+            return
+
+def answer_on_snapshot(pending, results, args, snapshot, memo, statement_timeout=None, active=None, host=None,
+                       statements=None):
+    """Ответы на вопросы из очереди pending в одном подключении на общем снимке данных.
+
+    statements - список профилируемого запроса, в который записываются выполненные SQL.
+    """
     try:
-        engine = connection_db()
-        
-        avg_q = """
-        SELECT 
-            AVG(days_cnt) AS avg_days,
-            AVG(visitors_cnt) AS avg_group,
-            AVG(spent) AS avg_trip,
-            AVG(spent / NULLIF(visitors_cnt, 0)) AS avg_person,
-            PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY days_cnt) AS med_days,
-            PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY spent / NULLIF(visitors_cnt, 0)) AS med_person
-        FROM visits
-        WHERE territory_name LIKE '%Нижний Новгород%'
-        """
-        
-        mode_age = """
-        SELECT age FROM visits 
-        WHERE territory_name LIKE '%Нижний Новгород%' AND age != 'неизвестно'
-        GROUP BY age ORDER BY COUNT(*) DESC LIMIT 1
-        """
-        
-        mode_gender = """
-        SELECT gender FROM visits 
-        WHERE territory_name LIKE '%Нижний Новгород%' AND gender != 'неизвестно'
-        GROUP BY gender ORDER BY COUNT(*) DESC LIMIT 1
-        """
-        
-        mode_income = """
-        SELECT income FROM visits 
-        WHERE territory_name LIKE '%Нижний Новгород%' AND income != 'неизвестно'
-        GROUP BY income ORDER BY COUNT(*) DESC LIMIT 1
-        """
-        
-        mode_goal = """
-        SELECT goal FROM visits 
-        WHERE territory_name LIKE '%Нижний Новгород%' AND goal != 'неизвестно'
-        GROUP BY goal ORDER BY COUNT(*) DESC LIMIT 1
-        """
-        
-        mode_trip = """
-        SELECT trip_type FROM visits 
-        WHERE territory_name LIKE '%Нижний Новгород%' AND trip_type != 'неизвестно'
-        GROUP BY trip_type ORDER BY COUNT(*) DESC LIMIT 1
-        """
-        
-        mode_region = """
-        SELECT home_region FROM visits 
-        WHERE territory_name LIKE '%Нижний Новгород%' AND home_region != 'неизвестно'
-        GROUP BY home_region ORDER BY COUNT(*) DESC LIMIT 1
-        """
-        
-        mode_city = """
-        SELECT home_city FROM visits 
-        WHERE territory_name LIKE '%Нижний Новгород%' AND home_city != 'неизвестно'
-        GROUP BY home_city ORDER BY COUNT(*) DESC LIMIT 1
-        """
-        
-        with engine.connect() as conn:
-            avg_res = conn.execute(text(avg_q))
-            avg = avg_res.fetchone()
-            
-            age_res = conn.execute(text(mode_age))
-            age = age_res.fetchone()
-            
-            gender_res = conn.execute(text(mode_gender))
-            gender = gender_res.fetchone()
-            
-            income_res = conn.execute(text(mode_income))
-            income = income_res.fetchone()
-            
-            goal_res = conn.execute(text(mode_goal))
-            goal = goal_res.fetchone()
-            
-            trip_res = conn.execute(text(mode_trip))
-            trip = trip_res.fetchone()
-            
-            region_res = conn.execute(text(mode_region))
-            region = region_res.fetchone()
-            
-            city_res = conn.execute(text(mode_city))
-            city = city_res.fetchone()
-        
-        def get(row, default=None):
-            if row is not None and len(row) > 0 and row[0] is not None:
-                return convert_for_json(row[0])
-            return default
-        
-        age = get(age, 'не указан')
-        gender = get(gender, 'человек')
-        income = get(income, 'не указан')
-        goal = get(goal, 'разные цели')
-        trip_type = get(trip, 'разные')
-        region = get(region, 'разных регионов')
-        city = get(city, 'не указан')
-        
-        trip = (convert_for_json(avg[2]) or 0) * 1_000_000
-        person = (convert_for_json(avg[3]) or 0) * 1_000_000
-        med_person = (convert_for_json(avg[5]) or 0) * 1_000_000 if len(avg) > 5 else 0
-        
-        desc = f"Профиль туриста: {gender} в возрасте {age}, "
-        desc += f"с доходом {income}. Приезжает из {region} "
-        desc += f"(город {city}). Цель - {goal}, "
-        desc += f"тип поездки - {trip_type}. Останавливается на {round(convert_for_json(avg[0]) or 0, 1)} дней, "
-        desc += f"группа {round(convert_for_json(avg[1]) or 0, 1)} чел. Тратит за поездку {round(trip, 0):,.0f} руб "
-        desc += f"({round(person, 0):,.0f} руб./чел)."
-        
+        engine = connection_db(statement_timeout=statement_timeout, host=host)
+        conn, trans = begin_snapshot(engine, snapshot)
+        if statements is not None:
+            conn.info['profile_statements'] = statements
+    except Exception as e:
+        # Без подключения оставшиеся вопросы получают ошибку, чтобы пакет не ждал их вечно
+        for q_id in pending_ids(pending):
+            results.put((q_id, {'error': str(e)}))
+        return
+
+    if active is not None:
+        active.append(conn.connection.connection)
+    try:
+        for q_id in pending_ids(pending):
+            try:
+                results.put(next(answer_questions(conn, [q_id], args, memo)))
+            except Exception as e:
+                # Например, подключение оборвалось: ответ все равно нужен, иначе пакет зависнет
+                results.put((q_id, {'error': str(e)}))
+    finally:
+        trans.rollback()
+        conn.close()
+
+def batch_budget(ids):
+    """Бюджет пакета: суммарный вес и наибольший таймаут входящих вопросов"""
+    weight = sum(QUERY_BUDGETS[q_id]['weight'] for q_id in ids)
+    timeout_ms = max(QUERY_BUDGETS[q_id]['timeout_ms'] for q_id in ids)
+    return weight, timeout_ms
+
+def iter_batch_answers(ids, args, parallel=True, statement_timeout=None, statements=None):
+    """Ответы на несколько вопросов по одному снимку данных, по мере готовности"""
+    # Снимок импортируется только на том же хосте, где он экспортирован
+    engine, host = read_connection_db(statement_timeout=statement_timeout)
+    conn, trans = begin_snapshot(engine)
+    memo = {}
+    # Подключения, запросы в которых нужно отменить, если ответ больше не нужен
+    active = [conn.connection.connection]
+
+    def cancel():
+        for dbapi_conn in list(active):
+            dbapi_conn.cancel()
+
+    try:
+        with cancel_on_disconnect(cancel):
+            if parallel and len(ids) > 1:
+                # Каждый поток один раз импортирует снимок и берет вопросы из общей очереди,
+                # поэтому ответы согласованы, а подключений не больше BATCH_WORKERS + 1
+                snapshot = conn.execute(text("SELECT pg_export_snapshot()")).scalar()
+                pending = queue.Queue()
+                for q_id in ids:
+                    pending.put(q_id)
+                results = queue.Queue()
+                workers = min(len(ids), BATCH_WORKERS)
+                pool = ThreadPoolExecutor(max_workers=workers)
+                try:
+                    for _ in range(workers):
+                        pool.submit(
+                            answer_on_snapshot, pending, results, args, snapshot, memo,
+                            statement_timeout, active, host, statements
+                        )
+                    for _ in ids:
+                        yield results.get()
+                except GeneratorExit:
+                    cancel()
+                    raise
+                finally:
+                    # Непрочитанные вопросы больше не нужны
+                    list(pending_ids(pending))
+                    pool.shutdown()
+            else:
+                yield from answer_questions(conn, ids, args, memo)
+    finally:
+        trans.rollback()
+        conn.close()
+
+@app.route('/api/questions', methods=['GET'])
+def questions_batch():
+    """Ответы на несколько вопросов за один запрос"""
+    try:
+        ids = parse_question_ids(request.args.get('ids'))
+        approx_fraction(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    args = request.args.to_dict()
+    parallel = request.args.get('parallel', '1') != '0'
+    weight, timeout_ms = batch_budget(ids)
+    g.profile_weight = weight
+
+    if request.args.get('stream') == '1':
+        try:
+            heavy_queries.acquire(weight)
+        except Overloaded as e:
+            return error_response(e)
+
+        def generate():
+            try:
+                for q_id, payload in iter_batch_answers(ids, args, parallel, timeout_ms):
+                    yield app.json.dumps({'id': q_id, 'result': payload}, ensure_ascii=False) + '\n'
+            except Exception as e:
+                yield app.json.dumps({'error': str(e)}, ensure_ascii=False) + '\n'
+
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        # Бюджет освобождается, даже если клиент отключился до начала потока
+        response.call_on_close(lambda: heavy_queries.release(weight))
+        return response
+
+    try:
+        with heavy_queries.admit(weight):
+            answers = dict(iter_batch_answers(ids, args, parallel, timeout_ms, g.get('profile_statements')))
         return jsonify({
-            'question': 'Как выглядит профиль среднестатистического туриста?',
-            'answer': {
-                'numbers': {
-                    'days': round(convert_for_json(avg[0]) or 0, 1),
-                    'group': round(convert_for_json(avg[1]) or 0, 1),
-                    'trip': round(trip, 0),
-                    'person': round(person, 0),
-                    'med_days': convert_for_json(avg[4]) if len(avg) > 4 else None,
-                    'med_person': round(med_person, 0) if len(avg) > 5 else None
-                },
-                'categories': {
-                    'age': age,
-                    'gender': gender,
-                    'income': income,
-                    'goal': goal,
-                    'trip': trip_type,
-                    'region': region,
-                    'city': city
-                },
-                'text': desc
-            }
+            'questions': ids,
+            'answers': {str(q_id): answers[q_id] for q_id in ids}
         })
-        
+
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
+
+@app.route('/api/stream', methods=['GET'])
+def stream_events():
+    """Server-Sent Events: уведомления о загрузках новых данных"""
+    ensure_listener()
+    events = queue.Queue(maxsize=SSE_QUEUE_SIZE)
+    with subscribers_lock:
+        subscribers.append(events)
+
+    def unsubscribe():
+        with subscribers_lock:
+            if events in subscribers:
+                subscribers.remove(events)
+
+    def generate():
+        yield f"retry: {LISTEN_RETRY * 1000}\n\n"
+        while True:
+            try:
+                event_type, data = events.get(timeout=SSE_HEARTBEAT)
+            except queue.Empty:
+                yield ": ping\n\n"
+                continue
+            yield f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    response.call_on_close(unsubscribe)
+    return response
 
 @app.route('/api/export', methods=['POST'])
 def export_data_simple():
@@ -671,4 +1647,5 @@ if __name__ == '__main__':
     print("   - http://localhost:5000/api/question/4")
     print("   - http://localhost:5000/api/question/5")
     print("   - http://localhost:5000/api/question/6")
+    print("   - http://localhost:5000/api/questions?ids=1,2,4&start_date=2021-01-01&end_date=2021-05-01")
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
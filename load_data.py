@@ -4,13 +4,15 @@ import numpy as np
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
 import urllib.parse
+import sys
 import time
+import json
 
 # Загружаем переменные окружения из файла .env
 load_dotenv()
 
 def connection_db():
-    """Создает подключение к базе данных"""
+    """Создает подключение к мастеру: загрузка никогда не идет в реплики"""
     
     host = os.getenv('HOST')
     port = os.getenv('PORT')
@@ -20,23 +22,228 @@ def connection_db():
     sslmode = os.getenv('SSLMODE')
     
     pass_shielding = urllib.parse.quote_plus(password)
-    conn = f"postgresql://{user}:{pass_shielding}@{host}:{port}/{dbname}?sslmode={sslmode}&sslrootcert={os.path.expanduser('~/.postgresql/root.crt')}"
+    conn = f"postgresql://{user}:{pass_shielding}@{host}:{port}/{dbname}?sslmode={sslmode}&sslrootcert={os.path.expanduser('~/.postgresql/root.crt')}&target_session_attrs=read-write"
     engine = create_engine(conn)
     return engine
 
+# Колонки с датами в выгрузке
+DATE_COLUMNS = ['DATE_OF_ARRIVAL']
+# Текстовые колонки выгрузки: читаются как строки, даже если в чанке одни пропуски
+CATEGORICAL_COLUMNS = [
+    'TERRITORY_NAME', 'TRIP_TYPE', 'VISIT_TYPE', 'HOME_COUNTRY', 'HOME_REGION',
+    'HOME_CITY', 'GOAL', 'GENDER', 'AGE', 'INCOME'
+]
+CSV_DTYPES = {c: 'object' for c in CATEGORICAL_COLUMNS}
+# Хеш пропуска не зависит от типа, который pandas вывел для колонки в чанке
+NULL_HASH = np.uint64(0)
+# Сколько самых частых значений категориальной колонки попадает в отчет
+TOP_VALUES = 20
+# Больше уникальных значений колонку не считаем категориальной
+MAX_CATEGORIES = 10000
+# Емкость фильтра Блума (ожидаемое число строк); по умолчанию оценивается по размеру файла
+BLOOM_CAPACITY = os.getenv('BLOOM_CAPACITY')
+# Запас к оценке числа строк, чтобы фактическая ошибка не превысила целевую
+BLOOM_CAPACITY_MARGIN = 1.5
+# Сколько байт с начала файла читается для оценки средней длины строки
+ESTIMATE_SAMPLE_BYTES = 1 << 20
+
+def estimate_rows(file_path):
+    """Оценка числа строк CSV по размеру файла и средней длине первых строк"""
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        sample = f.read(ESTIMATE_SAMPLE_BYTES)
+    lines = sample.count(b'\n')
+    if lines == 0:
+        return 1
+    return int(size / (len(sample) / lines)) + 1
+
+def bloom_capacity(file_path=None):
+    """Емкость фильтра Блума: BLOOM_CAPACITY или оценка по файлу с запасом"""
+    if BLOOM_CAPACITY:
+        return int(BLOOM_CAPACITY)
+    if file_path and os.path.exists(file_path):
+        return max(int(estimate_rows(file_path) * BLOOM_CAPACITY_MARGIN), 1000)
+    return 10_000_000
+
+class BloomFilter:
+    """Приблизительное множество хешей строк для подсчета дубликатов"""
+
+    def __init__(self, capacity=10_000_000, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.m = int(-capacity * np.log(error_rate) / np.log(2) ** 2)
+        self.k = max(1, round(self.m / capacity * np.log(2)))
+        self.bits = np.zeros((self.m + 7) // 8, dtype=np.uint8)
+        self.inserted = 0
+
+    def effective_error_rate(self):
+        """Вероятность ложного срабатывания при фактическом числе добавленных хешей"""
+        return float((1 - np.exp(-self.k * self.inserted / self.m)) ** self.k)
+
+    def add(self, hashes):
+        """Добавление хешей; возвращает маску тех, что (вероятно) уже встречались"""
+        h1 = hashes & np.uint64(0xFFFFFFFF)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        seen = np.ones(len(hashes), dtype=bool)
+        positions = []
+        for i in range(self.k):
+            pos = (h1 + np.uint64(i) * h2) % np.uint64(self.m)
+            byte, bit = pos >> np.uint64(3), (pos & np.uint64(7)).astype(np.uint8)
+            seen &= (self.bits[byte] >> bit) & 1 == 1
+            positions.append((byte, bit))
+        for byte, bit in positions:
+            np.bitwise_or.at(self.bits, byte, np.left_shift(np.uint8(1), bit))
+        self.inserted += int((~seen).sum())
+        return seen
+
+class DatasetProfiler:
+    """Профиль качества данных за один проход по чанкам read_csv"""
+
+    def __init__(self, file_path=None, capacity=None):
+        self.file_path = file_path
+        self.rows = 0
+        self.duplicates = 0
+        self.columns = {}
+        self.bloom = BloomFilter(capacity or bloom_capacity(file_path))
+
+    def update(self, chunk):
+        """Учет очередного чанка"""
+        self.rows += len(chunk)
+
+        for c in chunk.columns:
+            col = chunk[c]
+            stats = self.columns.get(c)
+            if stats is None:
+                stats = self.columns[c] = {'nulls': 0}
+            # Тип колонки из одних пропусков неизвестен, его определит следующий чанк
+            if 'kind' not in stats or stats['pending'] and col.notna().any():
+                if c.upper() in DATE_COLUMNS:
+                    kind = 'date'
+                elif c.upper() in CATEGORICAL_COLUMNS or not pd.api.types.is_numeric_dtype(col):
+                    kind = 'categorical'
+                else:
+                    kind = 'numeric'
+                stats.update({'kind': kind, 'dtype': str(col.dtype), 'pending': bool(col.isna().all())})
+                if kind == 'categorical':
+                    stats.setdefault('values', {})
+
+            stats['nulls'] += int(col.isna().sum())
+
+            if stats['kind'] == 'numeric':
+                values = pd.to_numeric(col, errors='coerce').dropna()
+                if len(values):
+                    stats['min'] = min(stats.get('min', values.min()), values.min())
+                    stats['max'] = max(stats.get('max', values.max()), values.max())
+                    stats['sum'] = stats.get('sum', 0) + float(values.sum())
+                    stats['count'] = stats.get('count', 0) + len(values)
+            elif stats['kind'] == 'date':
+                values = pd.to_datetime(col, errors='coerce').dropna()
+                if len(values):
+                    stats['min'] = min(stats.get('min', values.min()), values.min())
+                    stats['max'] = max(stats.get('max', values.max()), values.max())
+            elif stats['values'] is not None:
+                counts = stats['values']
+                for value, cnt in col.value_counts().items():
+                    counts[value] = counts.get(value, 0) + int(cnt)
+                if len(counts) > MAX_CATEGORIES:
+                    stats['values'] = None
+
+        # Дубликаты внутри чанка считаем точно, между чанками - через фильтр Блума
+        hashes = self.row_hashes(chunk)
+        in_chunk = pd.Series(hashes).duplicated().to_numpy()
+        self.duplicates += int(in_chunk.sum())
+        unique = hashes[~in_chunk]
+        self.duplicates += int(self.bloom.add(unique).sum())
+
+    def row_hashes(self, chunk):
+        """Хеши строк, одинаковые для одинаковых строк из разных чанков.
+
+        Колонка хешируется по типу из профиля, а не по типу, выведенному для
+        чанка, а пропуски получают общий хеш NULL_HASH.
+        """
+        columns = {}
+        for c in chunk.columns:
+            col = chunk[c]
+            if self.columns[c]['kind'] == 'numeric':
+                col = pd.to_numeric(col, errors='coerce').astype('float64')
+            else:
+                col = col.astype(object)
+            h = pd.util.hash_pandas_object(col, index=False).to_numpy().copy()
+            h[col.isna().to_numpy()] = NULL_HASH
+            columns[c] = h
+        return pd.util.hash_pandas_object(pd.DataFrame(columns), index=False).to_numpy()
+
+    def report(self):
+        """Отчет о качестве данных в виде словаря для JSON"""
+        columns = {}
+        for c, stats in self.columns.items():
+            info = {'kind': stats['kind'], 'dtype': stats['dtype'], 'nulls': stats['nulls']}
+            if stats['kind'] == 'numeric' and stats.get('count'):
+                info['min'] = float(stats['min'])
+                info['max'] = float(stats['max'])
+                info['mean'] = stats['sum'] / stats['count']
+            elif stats['kind'] == 'date' and 'min' in stats:
+                info['min'] = stats['min'].isoformat()
+                info['max'] = stats['max'].isoformat()
+            elif stats['kind'] == 'categorical':
+                if stats['values'] is None:
+                    info['distinct'] = f">{MAX_CATEGORIES}"
+                else:
+                    top = sorted(stats['values'].items(), key=lambda x: x[1], reverse=True)[:TOP_VALUES]
+                    info['distinct'] = len(stats['values'])
+                    info['top'] = {str(value): cnt for value, cnt in top}
+            columns[c] = info
+
+        dtypes = {}
+        for stats in self.columns.values():
+            dtypes[stats['dtype']] = dtypes.get(stats['dtype'], 0) + 1
+
+        return {
+            'file': self.file_path,
+            'rows': self.rows,
+            'columns_count': len(self.columns),
+            'nulls': sum(stats['nulls'] for stats in self.columns.values()),
+            'duplicates': {
+                'count': self.duplicates,
+                'method': 'bloom',
+                'capacity': self.bloom.capacity,
+                'target_error_rate': self.bloom.error_rate,
+                # Если строк больше емкости, ошибка выше целевой
+                'error_rate': self.bloom.effective_error_rate()
+            },
+            'dtypes': dtypes,
+            'columns': columns
+        }
+
+    def save(self, folder='reports'):
+        """Сохранение отчета в reports/<имя файла>.quality.json"""
+        os.makedirs(folder, exist_ok=True)
+        name = os.path.splitext(os.path.basename(self.file_path or 'dataset'))[0]
+        path = os.path.join(folder, f"{name}.quality.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2, default=str)
+        return path
+
 def data_info(df):
     """Краткая информация о датасете"""
-    print(f"Размерность: {df.shape[0]} строк, {df.shape[1]} столбцов")
+    profiler = DatasetProfiler(capacity=max(len(df), 1000))
+    profiler.update(df)
+    report = profiler.report()
+
+    print(f"Размерность: {report['rows']} строк, {report['columns_count']} столбцов")
 
-    print(f"\nПропущенные значения (всего): {df.isna().sum().sum()}")
-    if df.isna().sum().sum() > 0:
+    print(f"\nПропущенные значения (всего): {report['nulls']}")
+    if report['nulls'] > 0:
         print("\nПропущенные значения по столбцам:")
-        print(df.isna().sum()[df.isna().sum() > 0])
+        for c, info in report['columns'].items():
+            if info['nulls'] > 0:
+                print(f"{c}    {info['nulls']}")
     
-    print(f"\nДубликаты строк: {df.duplicated().sum()}")
+    print(f"\nДубликаты строк: {report['duplicates']['count']}")
     
     print(f"\nТипы данных:")
-    print(df.dtypes.value_counts())
+    for dtype, cnt in report['dtypes'].items():
+        print(f"{dtype}    {cnt}")
 
 def preprocess_data(df):
     """Предобработка данных"""
@@ -66,18 +273,49 @@ def preprocess_data(df):
     
     return df_clean
 
+# Канал, в который API слушает уведомления о загрузках
+LOAD_CHANNEL = 'visits_loaded'
+
+def notify_loaded(connection, df, table_name='visits'):
+    """Уведомление API о загруженном диапазоне дат"""
+    if df.empty:
+        return
+    notify_range(
+        connection,
+        df['date_of_arrival'].min().date(),
+        df['date_of_arrival'].max().date(),
+        len(df),
+        table_name
+    )
+
+def notify_range(connection, min_date, max_date, rows, table_name='visits'):
+    """NOTIFY об изменении строк в диапазоне дат; доставляется после коммита"""
+    payload = {
+        'table': table_name,
+        'min_date': min_date.isoformat(),
+        'max_date': max_date.isoformat(),
+        'rows': rows
+    }
+    connection.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {'channel': LOAD_CHANNEL, 'payload': json.dumps(payload)}
+    )
+
 def load_data_to_db(df, table_name='visits'):
     """Загрузка а базу данных"""
 
     conn = connection_db()
     try:
-        df.to_sql(
-            name=table_name,
-            con=conn,
-            if_exists='append',
-            index=False,
-            chunksize=10000
-        )
+        # NOTIFY в той же транзакции доставляется подписчикам только после коммита
+        with conn.begin() as connection:
+            df.to_sql(
+                name=table_name,
+                con=connection,
+                if_exists='append',
+                index=False,
+                chunksize=10000
+            )
+            notify_loaded(connection, df, table_name)
         print(f"Загружено {len(df)} строк")
 
     except Exception as e:
@@ -86,6 +324,72 @@ def load_data_to_db(df, table_name='visits'):
 
     return len(df)
     
+# Сколько последних месяцев остается в горячей таблице visits
+ARCHIVE_HORIZON_MONTHS = int(os.getenv('ARCHIVE_HORIZON_MONTHS', 24))
+
+def archive_old_months(horizon_months=ARCHIVE_HORIZON_MONTHS, table_name='visits', archive_table='visits_archive'):
+    """Перенос месяцев старше горизонта из горячей таблицы в подневные агрегаты.
+
+    В архиве остаются суммы по дню, территории и месту проживания - ровно то,
+    что нужно ответам за весь период и за произвольный диапазон дат (вопросы 1-3).
+    """
+    cutoff = (pd.Timestamp.today().normalize().replace(day=1) - pd.DateOffset(months=horizon_months)).date()
+
+    conn = connection_db()
+    try:
+        with conn.begin() as connection:
+            connection.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {archive_table} (
+                    date_of_arrival DATE NOT NULL,
+                    territory_name VARCHAR(100),
+                    home_country VARCHAR(100),
+                    home_region VARCHAR(100),
+                    home_city VARCHAR(100),
+                    visitors_cnt BIGINT,
+                    trips_cnt BIGINT,
+                    spent NUMERIC(16, 3)
+                )
+            """))
+            # Один оператор: в архив попадают ровно удаленные строки, даже если
+            # параллельная загрузка добавила в visits строки старше горизонта
+            min_date, max_date, moved = connection.execute(text(f"""
+                WITH moved AS (
+                    DELETE FROM {table_name}
+                    WHERE date_of_arrival < :cutoff
+                    RETURNING date_of_arrival, territory_name, home_country, home_region,
+                        home_city, visitors_cnt, spent
+                ), archived AS (
+                    INSERT INTO {archive_table}
+                    SELECT
+                        date_of_arrival::date,
+                        territory_name,
+                        home_country,
+                        home_region,
+                        home_city,
+                        SUM(visitors_cnt),
+                        COUNT(*),
+                        SUM(spent)
+                    FROM moved
+                    GROUP BY 1, 2, 3, 4, 5
+                )
+                SELECT MIN(date_of_arrival)::date, MAX(date_of_arrival)::date, COUNT(*) FROM moved
+            """), {'cutoff': cutoff}).fetchone()
+            # Ответы только по горячим строкам (вопросы 4-6) после переноса меняются
+            if moved:
+                notify_range(connection, min_date, max_date, moved, archive_table)
+
+        # Освобождаем место удаленных строк, чтобы горячая таблица оставалась компактной
+        with conn.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.execute(text(f"VACUUM ANALYZE {table_name}"))
+
+        print(f"Перенесено в архив {moved} строк (месяцы до {cutoff})")
+
+    except Exception as e:
+        print(f"Ошибка архивации {e}")
+        raise
+
+    return moved
+
 def test_upload_data(table_name='visits'):
     """Проверка загруженных данных"""
     conn = connection_db()
@@ -109,14 +413,21 @@ def test_upload_data(table_name='visits'):
 
 if __name__ == "__main__":
     
+    if '--archive' in sys.argv:
+        archive_old_months()
+        sys.exit()
+
     file_path = "data/final.csv"
     count = 0
+    profiler = DatasetProfiler(file_path)
     
-    for chunk in pd.read_csv(file_path, chunksize=10000):
+    for chunk in pd.read_csv(file_path, chunksize=10000, dtype=CSV_DTYPES):
+        profiler.update(chunk)
         chunk_clean = preprocess_data(chunk)
         count += load_data_to_db(chunk_clean)
         print(f"Загружено: {count} строк")
     
     print(f"\nВсего: {count} строк")
+    print(f"Отчет о качестве данных: {profiler.save()}")
     test_upload_data()
     
\ No newline at end of file